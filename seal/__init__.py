@@ -0,0 +1,7 @@
+from seal.compiler import (  # noqa: F401
+    CompileError,
+    CompileResult,
+    compile,
+    compile_async,
+    compile_many,
+)
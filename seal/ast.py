@@ -1,22 +1,43 @@
+import threading
 from io import IOBase, StringIO
-from typing import TypeVar, Generic, List, Generator, Optional, Dict
+from typing import (TypeVar, Generic, List, Generator, Optional, Dict,
+                    Set)
 from dataclasses import dataclass
 from collections import defaultdict
-from seal import langspec
+from seal import langspec, modules, peephole
 from seal.config import Config
 from seal.scanner import TokenType, Token, scan
 
 max_scratch_space = 256
-scratch_space: List[str] = []
-label_counter = defaultdict(lambda: 0)
-constants: Dict[str, str or int] = {}
+
+
+class State(threading.local):
+    """Per-thread compiler state, so that concurrent compilations running
+    in separate threads do not share scratch slots, labels or constants."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.scratch_space: List[str] = []
+        self.label_counter = defaultdict(lambda: 0)
+        self.constants: Dict[str, str or int] = {}
+        # Paths of the modules being imported, innermost last
+        self.import_stack: List[str] = []
+        self.imported: Set[str] = set()
+        # Paths of the imported modules by their namespace
+        self.namespaces: Dict[str, str] = {}
+        self.namespace = ''
+
+
+state = State()
 
 
 def allocate_label(label: str = None) -> int:
     label = label or 'label'
-    counter = label_counter[label]
+    counter = state.label_counter[label]
     alias = f'{label}_{counter}'
-    label_counter[label] += 1
+    state.label_counter[label] += 1
     return alias
 
 
@@ -24,16 +45,16 @@ def allocate_scratch_space(name: str) -> int:
     index = refer_scratch_space(name)
     if index >= 0:
         return index
-    index = len(scratch_space)
+    index = len(state.scratch_space)
     if index < max_scratch_space:
-        scratch_space.append(name)
+        state.scratch_space.append(name)
         return index
     return -1
 
 
 def refer_scratch_space(name) -> int:
     try:
-        return scratch_space.index(name)
+        return state.scratch_space.index(name)
     except ValueError:
         return -1
 
@@ -175,6 +196,10 @@ class Node(Generic[T]):
             return Function(token, children=children, config=config)
         elif token.token_type == TokenType.ITXN:
             return ITxn(token, children=children, config=config)
+        elif token.token_type == TokenType.ITXN_GROUP:
+            return ITxnGroup(token, children=children, config=config)
+        elif token.token_type == TokenType.IMPORT:
+            return Import(token, children=children, config=config)
 
         raise NodeError('Invalid token', token=token)
 
@@ -203,7 +228,7 @@ class Opcode(Node):
                 if child.children:
                     child = child.children[0]
                 else:
-                    child = constants[child.command]
+                    child = state.constants[child.command]
 
             if isinstance(child, Opcode) and child.spec.returns:
                 total_height += len(child.spec.returns)
@@ -239,6 +264,7 @@ class Opcode(Node):
             raise NodeError('Invalid number of stack args', token=self.token)
 
         if self.spec.immediate_args:
+            self.resolve_qualified_label()
             if len(self.immediate_args) != len(self.spec.immediate_args):
                 raise NodeError('Invalid number of immediate args',
                                 token=self.token)
@@ -257,13 +283,35 @@ class Opcode(Node):
                     # Validate non-ref immediate args
                     pass
 
+    def resolve_qualified_label(self):
+        """Points `b.module.label` style references to the label of an
+        imported module"""
+        encodings = [arg.encoding for arg in self.spec.immediate_args]
+        if encodings != [langspec.Encoding.LABEL] or \
+                len(self.immediate_args) != 2:
+            return
+        namespace, label = self.immediate_args
+        if namespace not in state.namespaces:
+            raise NodeError(f'Module {namespace} not imported',
+                            token=self.token)
+        self.immediate_args_override = [modules.qualify(namespace, label)]
+
 
 class Label(Node):
 
+    def validate(self):
+        super().validate()
+        if state.namespace:
+            self.alias = modules.qualify(state.namespace, self.token.head)
+
+    @property
+    def name(self) -> str:
+        return self.token.head.rstrip(':')
+
     def emit(self) -> List[str]:
         lines = []
         lines.append(self.command)
-        for child in self.children:
+        for child in self.children or []:
             lines.extend(child.emit())
         return lines
 
@@ -318,8 +366,14 @@ class Case(Node):
         return lines
 
 
+@dataclass
 class While(Node):
 
+    # Statements evaluated once before entering the loop
+    preheader: Optional[List[Node]] = None
+    # Number of times the body runs, when known at compile time
+    trips: Optional[int] = None
+
     def validate(self):
         super().validate()
         if not self.children or len(self.children) < 2:
@@ -328,6 +382,8 @@ class While(Node):
     def emit(self) -> List[str]:
         label = allocate_label('while')
         lines = []
+        for node in self.preheader or []:
+            lines.extend(node.emit())
         lines.append(f'{label}:')
         lines.extend(self.children[0].emit())
         lines.append(f'bz {label}_end')
@@ -345,15 +401,16 @@ class Function(Node):
 class Variable(Opcode):
 
     def validate(self):
+        name = state.namespace + self.command
         if self.children:
-            index = allocate_scratch_space(self.command)
+            index = allocate_scratch_space(name)
             if index < 0:
                 raise NodeError('Scratch space overflow', token=self.token)
             self.immediate_args_override = [str(index)]
             self.doc = self.command
             self.alias = 'store'
         else:
-            index = refer_scratch_space(self.command)
+            index = refer_scratch_space(name)
             if index < 0:
                 raise NodeError('Scratch space not found', token=self.token)
             self.immediate_args_override = [str(index)]
@@ -374,21 +431,21 @@ class Const(Node):
                 raise NodeError(
                     f'Constants accepts only the following: {valid_childs}'
                 )
-            if self.token.value in constants:
+            if self.token.value in state.constants:
                 raise NodeError(
                     f'Constant already defined {self.token.value}'
                 )
 
-            constants[self.command] = self.children[0]
+            state.constants[self.command] = self.children[0]
         else:
-            if self.command not in constants:
+            if self.command not in state.constants:
                 raise NodeError(f'Constant {self.command} not defined yet',
                                 token=self.token)
 
     def emit(self) -> List[str]:
         if self.children:
             return []
-        line = constants[self.command].emit().pop()
+        line = state.constants[self.command].emit().pop()
         return [f'{line} // {self.token.value}']
 
 
@@ -397,6 +454,8 @@ class Root(Node):
     def emit(self) -> List[str]:
         lines = ['#pragma version {}'.format(self.config.pragma_version)]
         lines.extend(super().emit())
+        if self.config.tail_merge:
+            lines = peephole.merge_tails(lines)
         return lines
 
 
@@ -411,10 +470,154 @@ class ITxn(Node):
         if not all_field:
             raise NodeError('#itxn requires all childs to be a itxn_field')
 
+        assigned = set()
+        for child in self.children:
+            name = '.'.join(child.immediate_args)
+            # Only array fields may be appended to more than once
+            if name in assigned and name not in langspec.fields['txna']:
+                raise NodeError(f'Field {name} assigned more than once',
+                                token=child.token)
+            assigned.add(name)
+
+    def emit_fields(self) -> List[str]:
+        lines = []
+        for child in self.children:
+            lines.extend(child.emit())
+        return lines
+
     def emit(self) -> List[str]:
         lines = []
         lines.append('itxn_begin')
-        for child in self.children[1:]:
-            lines.extend(child.emit())
+        lines.extend(self.emit_fields())
         lines.append('itxn_submit')
         return lines
+
+
+class ITxnGroup(Node):
+
+    max_group_size = 16
+
+    def validate(self):
+        super().validate()
+        if not self.children or len(self.children) == 0:
+            raise NodeError('#itxn_group requires 1 childs at min')
+
+        all_itxn = all([isinstance(c, ITxn) for c in self.children])
+        if not all_itxn:
+            raise NodeError('#itxn_group requires all childs to be a #itxn',
+                            token=self.token)
+
+        if len(self.children) > self.max_group_size:
+            raise NodeError(
+                f'#itxn_group accepts {self.max_group_size} childs at max',
+                token=self.token
+            )
+
+    @property
+    def savings(self) -> int:
+        """Opcode cost saved compared to submitting each child separately"""
+        begin, next_, submit = [
+            int(langspec.opcodes[name].cost)
+            for name in ('itxn_begin', 'itxn_next', 'itxn_submit')
+        ]
+        size = len(self.children)
+        separate = size * (begin + submit)
+        grouped = begin + (size - 1) * next_ + submit
+        return separate - grouped
+
+    def emit(self) -> List[str]:
+        lines = []
+        for i, child in enumerate(self.children):
+            lines.append('itxn_next' if i else 'itxn_begin')
+            lines.extend(child.emit_fields())
+        lines.append('itxn_submit // {} itxn grouped, saves {} opcodes'
+                     .format(len(self.children), self.savings))
+        return lines
+
+
+@dataclass
+class Import(Node):
+
+    path: Optional[str] = None
+
+    def validate(self):
+        super().validate()
+        if not self.children or len(self.children) != 1 or \
+                self.children[0].token.token_type != TokenType.BYTE:
+            raise NodeError('#import requires a single module path',
+                            token=self.token)
+
+        name = self.children[0].token.value.strip('"')
+        importer = state.import_stack[-1] if state.import_stack else None
+        self.path = modules.resolve(name, importer, self.config.import_paths)
+        if not self.path:
+            raise NodeError(f'Module {name} not found', token=self.token)
+        if self.path in state.import_stack:
+            raise NodeError(f'Circular import of module {name}',
+                            token=self.token)
+
+        self.children = []
+        if self.path in state.imported:
+            # Already included by another module of this program
+            return
+        state.imported.add(self.path)
+
+        namespace = modules.namespace(self.path)
+        if state.namespaces.setdefault(namespace, self.path) != self.path:
+            raise NodeError(
+                f'Module namespace {namespace} already used by another module',
+                token=self.token
+            )
+
+        tokens = iter(modules.cache.tokens(self.path))
+        outer_namespace = state.namespace
+        state.namespace = namespace
+        state.import_stack.append(self.path)
+        try:
+            while True:
+                try:
+                    self.children.append(
+                        Node._from_tokens(tokens, config=self.config)
+                    )
+                except StopIteration:
+                    break
+            self.scope_labels(state.namespace)
+        finally:
+            state.import_stack.pop()
+            state.namespace = outer_namespace
+
+    def scope_labels(self, namespace: str):
+        """Points branches of the module to its own, namespaced labels"""
+        nodes = list(module_nodes(self))
+        labels = {n.name for n in nodes if isinstance(n, Label)}
+        for node in nodes:
+            if not isinstance(node, Opcode) or not node.spec.immediate_args:
+                continue
+            encodings = [arg.encoding for arg in node.spec.immediate_args]
+            if not set(encodings) & {langspec.Encoding.LABEL,
+                                     langspec.Encoding.LABELS}:
+                continue
+            node.immediate_args_override = [
+                modules.qualify(namespace, arg) if arg in labels else arg
+                for arg in node.immediate_args
+            ]
+
+    def emit(self) -> List[str]:
+        lines = []
+        for child in self.children:
+            lines.extend(child.emit())
+        return lines
+
+
+def descendants(node: Node):
+    yield node
+    for child in node.children or []:
+        yield from descendants(child)
+
+
+def module_nodes(node: Node):
+    """Nodes below `node` excluding the ones of modules it imports"""
+    for child in node.children or []:
+        if not isinstance(child, Import):
+            yield child
+            yield from module_nodes(child)
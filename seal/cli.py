@@ -5,25 +5,33 @@ from dataclasses import asdict
 from komandr import command, arg, main as komandr_main
 
 from seal.config import Config
-from seal.ast import Node, NodeError
+from seal.compiler import compile as compile_source
 from seal import langspec
 
 
 @command
 @arg('file', help='file to read')
 @arg('pragma_version', '-p', help="pragma version", type=int)
-def compile(path, pragma_version=8):
+@arg('optimize', '-O', help="enable optimizations", action='store_true')
+@arg('import_paths', '-I', help="additional module directory",
+     action='append')
+def compile(path, pragma_version=8, optimize=False, import_paths=None):
     with open(path, encoding='utf-8') as f:
-        config = Config(pragma_version=pragma_version)
-        try:
-            print(Node.from_file(f, config=config))
-        except NodeError as e:
-            print('Compiler error: {}'.format(str(e)), file=sys.stderr)
-            if e.token:
+        config = Config(pragma_version=pragma_version, cse=optimize,
+                        licm=optimize, unroll=optimize, tail_merge=optimize,
+                        import_paths=import_paths or [])
+        result = compile_source(f.read(), config=config, path=path)
+    if not result.ok:
+        for error in result.errors:
+            print('Compiler error: {}'.format(error.message), file=sys.stderr)
+            if error.path:
+                print('File: {}'.format(error.path), file=sys.stderr)
+            if error.line is not None:
                 print('Ln: {}, Col: {}, Token: {}'.format(
-                    e.token.line, e.token.col, e.token.value
+                    error.line, error.col, error.token
                 ), file=sys.stderr)
-            exit(1)
+        exit(1)
+    print(result.teal)
 
 
 @command
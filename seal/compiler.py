@@ -0,0 +1,132 @@
+import asyncio
+import os
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from seal.ast import Node, NodeError, state
+from seal.config import Config
+from seal.optimizer import optimize
+
+
+@dataclass
+class CompileError:
+
+    message: str
+    line: Optional[int] = None
+    col: Optional[int] = None
+    token: Optional[str] = None
+    path: Optional[str] = None
+
+    @classmethod
+    def from_node_error(cls, e: NodeError):
+        if e.token:
+            return CompileError(message=str(e), line=e.token.line,
+                                col=e.token.col, token=e.token.value,
+                                path=e.token.path)
+        return CompileError(message=str(e))
+
+    def __str__(self) -> str:
+        if self.line is None:
+            return self.message
+        position = 'Ln: {}, Col: {}, Token: {}'.format(
+            self.line, self.col, self.token
+        )
+        if self.path:
+            position = 'File: {}, {}'.format(self.path, position)
+        return '{} ({})'.format(self.message, position)
+
+
+@dataclass
+class CompileResult:
+
+    teal: Optional[str] = None
+    errors: List[CompileError] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def compile(source: str, config: Optional[Config] = None,
+            path: Optional[str] = None) -> CompileResult:
+    """Compiles seal source into teal, reporting failures as structured
+    errors instead of raising. Imports are resolved relative to `path`, the
+    file the source was read from, and the configured import paths."""
+    state.reset()
+    if path:
+        state.import_stack.append(os.path.realpath(path))
+    try:
+        teal = str(optimize(Node.from_str(source, config=config)))
+    except NodeError as e:
+        return CompileResult(errors=[CompileError.from_node_error(e)])
+    except Exception as e:
+        return CompileResult(errors=[
+            CompileError('Internal compiler error: {!r}'.format(e))
+        ])
+    finally:
+        state.reset()
+    return CompileResult(teal=teal)
+
+
+async def wait(future: asyncio.Future,
+               timeout: Optional[float]) -> CompileResult:
+    # Shielded, so a timed out compilation keeps its future running and
+    # callers can still tell when its worker is actually free again
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        return CompileResult(errors=[
+            CompileError('Compilation timed out after {}s'.format(timeout))
+        ])
+
+
+async def compile_async(source: str, config: Optional[Config] = None,
+                        executor: Optional[Executor] = None,
+                        timeout: Optional[float] = None,
+                        path: Optional[str] = None) -> CompileResult:
+    """Runs `compile` in `executor` (the loop's default thread pool if not
+    given) so the event loop is never blocked by a compilation. Imports are
+    resolved relative to `path` as with `compile`.
+
+    A compilation exceeding `timeout` seconds is reported as an error. The
+    worker itself cannot be interrupted and finishes in the background."""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, compile, source, config, path)
+    return await wait(future, timeout)
+
+
+async def compile_many(sources: Iterable[str],
+                       config: Optional[Config] = None,
+                       executor: Optional[Executor] = None,
+                       timeout: Optional[float] = None,
+                       concurrency: int = 4,
+                       paths: Optional[Iterable[Optional[str]]] = None
+                       ) -> List[CompileResult]:
+    """Compiles a batch of sources with at most `concurrency` compilations
+    in flight, returning results in submission order. `paths`, if given,
+    holds the file each source was read from for resolving its imports.
+
+    A timed out compilation keeps holding its slot until its worker is done,
+    so slow inputs never pile up in the executor."""
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    sources = list(sources)
+    paths = list(paths) if paths is not None else [None] * len(sources)
+    if len(paths) != len(sources):
+        raise ValueError('paths must be given for each source')
+
+    async def bounded(source: str, path: Optional[str]) -> CompileResult:
+        await semaphore.acquire()
+        future = loop.run_in_executor(executor, compile, source, config,
+                                      path)
+        future.add_done_callback(lambda _: semaphore.release())
+        return await wait(future, timeout)
+
+    return await asyncio.gather(*[
+        bounded(source, path) for source, path in zip(sources, paths)
+    ])
@@ -1,8 +1,16 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 
 @dataclass
 class Config:
 
     pragma_version: Optional[int] = 8
+    cse: Optional[bool] = False
+    licm: Optional[bool] = False
+    unroll: Optional[bool] = False
+    tail_merge: Optional[bool] = False
+    # Limits guiding loop unrolling
+    max_program_size: Optional[int] = 2048
+    opcode_budget: Optional[int] = None
+    import_paths: List[str] = field(default_factory=list)
@@ -1,4 +1,5 @@
 import json
+import re
 import importlib.resources
 import seal
 
@@ -104,6 +105,16 @@ class Opcode(Generic[T]):
     def __str__(self) -> str:
         return '{}'.format(self.name)
 
+    @property
+    def static_cost(self) -> int:
+        """Cost as a plain int. Curve dependent costs resolve to the most
+        expensive curve and input dependent ones to their base cost."""
+        costs = re.findall(r'=(\d+)', self.cost or '')
+        if costs:
+            return max(int(cost) for cost in costs)
+        match = re.match(r'\s*(\d+)', self.cost or '')
+        return int(match.group(1)) if match else 1
+
     @classmethod
     def from_spec(cls, spec: Dict) -> T:
         immediate_args = None
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from io import StringIO
+from typing import Dict, List, Optional, Tuple
+
+from seal.scanner import Token, scan
+
+
+class ModuleCache:
+    """Scanned tokens of imported modules keyed by their path and the hash of
+    their content, so an unchanged module shared by many contracts is only
+    scanned once. The least recently used modules are evicted beyond
+    `max_size` entries."""
+
+    def __init__(self, max_size: int = 256):
+        self.modules: Dict[Tuple[str, str], List[Token]] = OrderedDict()
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    def tokens(self, path: str) -> List[Token]:
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        # Tokens carry the path they were scanned from, so identical files
+        # are cached separately to report errors against the right one
+        key = (path, hashlib.sha256(source.encode('utf-8')).hexdigest())
+        with self.lock:
+            tokens = self.modules.get(key)
+            if tokens is not None:
+                self.modules.move_to_end(key)
+        if tokens is None:
+            tokens = list(scan(StringIO(source), path=path))
+            with self.lock:
+                self.modules[key] = tokens
+                while len(self.modules) > self.max_size:
+                    self.modules.popitem(last=False)
+        return tokens
+
+    def clear(self):
+        with self.lock:
+            self.modules.clear()
+
+
+cache = ModuleCache()
+
+
+def resolve(name: str, importer: Optional[str],
+            import_paths: List[str]) -> Optional[str]:
+    """Finds the module `name` next to the importing module first, then in
+    the configured import paths. Modules resolving outside of all of these
+    directories, through `..` or symlinks, are never found."""
+    if os.path.isabs(name):
+        return None
+    dirs = [os.path.dirname(importer)] if importer else []
+    dirs.extend(import_paths)
+    roots = [os.path.realpath(d) for d in dirs]
+    for d in dirs:
+        path = os.path.realpath(os.path.join(d, name))
+        if os.path.isfile(path) and any(
+            os.path.commonpath([root, path]) == root for root in roots
+        ):
+            return path
+    return None
+
+
+def namespace(path: str) -> str:
+    """Label and scratch prefix derived from the module file name"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r'\W', '_', stem)
+
+
+def qualify(namespace: str, label: str) -> str:
+    """Name a label of the module with the given namespace is emitted as"""
+    return f'{namespace}__{label}'
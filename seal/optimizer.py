@@ -0,0 +1,793 @@
+import copy
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from seal import langspec
+from seal.ast import (Node, Opcode, Variable, Const, Comment, Root, Case,
+                      While, Label, ITxn, ITxnGroup, Import, allocate_label,
+                      allocate_scratch_space, descendants, state)
+from seal.peephole import line_cost, line_size
+from seal.scanner import Token, TokenType
+
+# Opcodes without side effects whose result only depends on their stack
+# args, immediate args and the state tags listed in `STATE_READS`.
+PURE_OPCODES = {
+    # Literals
+    'int', 'byte', 'addr', 'method', 'pushint', 'pushbytes', 'bzero',
+    # Transaction and global fields are fixed during an evaluation
+    'txn', 'txna', 'txnas', 'gtxn', 'gtxna', 'gtxns', 'gtxnsa', 'gtxnas',
+    'gtxnsas', 'global', 'gload', 'gloads', 'gaid', 'gaids', 'arg', 'args',
+    # Arithmetic
+    '+', '-', '/', '*', '%', '<', '>', '<=', '>=', '&&', '||', '==', '!=',
+    '!', '|', '&', '^', '~', 'shl', 'shr', 'sqrt', 'bitlen', 'exp', 'divw',
+    'len', 'itob', 'btoi', 'concat', 'getbit', 'setbit', 'getbyte',
+    'setbyte', 'sha256', 'keccak256', 'sha512_256', 'sha3_256',
+    'ed25519verify', 'ed25519verify_bare', 'ecdsa_verify',
+    # Byte arrays
+    'substring', 'substring3', 'extract', 'extract3', 'extract_uint16',
+    'extract_uint32', 'extract_uint64', 'replace2', 'replace3',
+    'base64_decode', 'json_ref', 'bsqrt', 'b+', 'b-', 'b/', 'b*', 'b%',
+    'b<', 'b>', 'b<=', 'b>=', 'b==', 'b!=', 'b|', 'b&', 'b^', 'b~',
+    # State reads
+    'app_global_get', 'app_local_get', 'app_opted_in', 'balance',
+    'min_balance',
+}
+
+# Global fields changing while a program is being evaluated
+VOLATILE_GLOBALS = {'OpcodeBudget'}
+
+STATE_READS = {
+    'app_global_get': 'app_global',
+    'app_local_get': 'app_local',
+    'app_opted_in': 'app_local',
+    'balance': 'balance',
+    'min_balance': 'balance',
+}
+
+STATE_WRITES = {
+    'app_global_put': {'app_global'},
+    'app_global_del': {'app_global'},
+    'app_local_put': {'app_local'},
+    'app_local_del': {'app_local'},
+    'itxn_submit': {'app_global', 'app_local', 'balance'},
+    # Boxes count towards the minimum balance of the app account
+    'box_create': {'balance'},
+    'box_del': {'balance'},
+    'box_put': {'balance'},
+    'box_resize': {'balance'},
+}
+
+# Position of the state key among the stack args of keyed state opcodes
+STATE_KEYS = {
+    'app_global_get': 0,
+    'app_global_put': 0,
+    'app_global_del': 0,
+    'app_local_get': 1,
+    'app_local_put': 1,
+    'app_local_del': 1,
+}
+
+# Pure opcodes which can not fail, so they may be evaluated even when the
+# original program would not reach them
+NON_TRAPPING_OPCODES = {
+    'int', 'byte', 'addr', 'method', 'pushint', 'pushbytes', 'txn', 'global',
+    '<', '>', '<=', '>=', '&&', '||', '==', '!=', '!', '|', '&', '^', '~',
+    'len', 'itob', 'bitlen', 'sha256', 'keccak256', 'sha512_256', 'sha3_256',
+}
+
+# Opcodes whose return type depends on the field given as immediate arg
+FIELD_OPCODES = {'txn', 'global'}
+
+# Opcodes accepting args of any type as long as both have the same type
+SAME_TYPE_OPCODES = {'==', '!='}
+
+MAX_UINT64 = 2 ** 64 - 1
+
+INT_OPERATORS = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': lambda a, b: a // b,
+    '%': lambda a, b: a % b,
+    '<': lambda a, b: int(a < b),
+    '>': lambda a, b: int(a > b),
+    '<=': lambda a, b: int(a <= b),
+    '>=': lambda a, b: int(a >= b),
+    '==': lambda a, b: int(a == b),
+    '!=': lambda a, b: int(a != b),
+    '&&': lambda a, b: int(bool(a and b)),
+    '||': lambda a, b: int(bool(a or b)),
+    '!': lambda a: int(not a),
+    '|': lambda a, b: a | b,
+    '&': lambda a, b: a & b,
+    '^': lambda a, b: a ^ b,
+    '~': lambda a: a ^ MAX_UINT64,
+}
+
+# Loops running longer than this are never unrolled
+MAX_TRIP_COUNT = 10000
+
+# Opcodes ending a basic block, either by branching or by touching state
+# that is not tracked by tags
+BARRIERS = {'b', 'bz', 'bnz', 'return', 'err', 'callsub', 'retsub',
+            'switch', 'match', 'stores'}
+
+# Opcodes with effects on state that is not tracked by tags
+OPAQUE = {'callsub', 'retsub', 'switch', 'match', 'stores'}
+
+
+def cost(name: str) -> int:
+    return langspec.opcodes[name].static_cost
+
+
+def is_load(node: Node) -> bool:
+    return isinstance(node, Variable) and not node.children
+
+
+def is_store(node: Node) -> bool:
+    return isinstance(node, Variable) and bool(node.children)
+
+
+def is_pure(node: Node) -> bool:
+    """Whether `node` evaluates to a single value without side effects"""
+    if isinstance(node, Const):
+        return not node.children
+    if is_load(node):
+        return True
+    if type(node) is not Opcode or node.command not in PURE_OPCODES:
+        return False
+    if node.command == 'global' and \
+            set(node.immediate_args) & VOLATILE_GLOBALS:
+        return False
+    children = node.children or []
+    if node.return_height != 1 or node.arg_height != len(children):
+        return False
+    return all(is_pure(child) for child in children)
+
+
+def constant_value(node: Node,
+                   env: Optional[Dict[str, int]] = None) -> Optional[int]:
+    """Evaluates integer arithmetic over int literals and the scratch slots
+    given in `env` at compile time, or returns None if that is not possible
+    or the opcodes would fail."""
+    if isinstance(node, Const) and not node.children:
+        node = state.constants[node.command]
+    if is_load(node):
+        return (env or {}).get(node.immediate_args[0])
+    if type(node) is not Opcode:
+        return None
+    if node.token.token_type == TokenType.INT:
+        return int(node.immediate_args[0])
+    children = node.children or []
+    operator = INT_OPERATORS.get(node.command)
+    if operator is None or len(children) != node.arg_height:
+        return None
+    values = [constant_value(child, env) for child in children]
+    if None in values:
+        return None
+    try:
+        value = operator(*values)
+    except ZeroDivisionError:
+        return None
+    return value if 0 <= value <= MAX_UINT64 else None
+
+
+def value_type(spec_type: str) -> Optional[str]:
+    """Narrows a stack type of the language spec down to `uint64` or
+    `[]byte`, or None if it can be either"""
+    if spec_type in ('uint64', 'bool'):
+        return 'uint64'
+    if spec_type in ('any', 'none'):
+        return None
+    return '[]byte'
+
+
+def stack_type(node: Node) -> Optional[str]:
+    """Type of the value `node` evaluates to when known at compile time,
+    either from literals or from the return types of the language spec"""
+    if isinstance(node, Const) and not node.children:
+        node = state.constants[node.command]
+    if type(node) is not Opcode:
+        return None
+    if node.token.token_type == TokenType.INT:
+        return 'uint64'
+    if node.token.token_type == TokenType.BYTE:
+        return '[]byte'
+    if node.command in FIELD_OPCODES:
+        types = {spec['Name']: spec['Type']
+                 for spec in langspec.langspec['Fields'][node.command]}
+        return value_type(types.get(node.immediate_args[0], 'any'))
+    returns = node.spec.returns or []
+    return value_type(returns[0].type.value) if len(returns) == 1 else None
+
+
+def is_non_trapping(node: Node) -> bool:
+    """Whether evaluating `node` can never fail, which requires the types of
+    all stack args to be known to match what the opcodes expect"""
+    if isinstance(node, Const) or is_load(node):
+        return True
+    if constant_value(node) is not None:
+        return True
+    if node.command not in NON_TRAPPING_OPCODES:
+        return False
+    children = node.children or []
+    args = node.spec.args or []
+    if len(children) != len(args) or \
+            not all(is_non_trapping(child) for child in children):
+        return False
+    types = [stack_type(child) for child in children]
+    if node.command in SAME_TYPE_OPCODES:
+        return None not in types and len(set(types)) == 1
+    return all(expected is None or actual == expected for actual, expected
+               in zip(types, [value_type(arg.type.value) for arg in args]))
+
+
+def literal_bytes(node: Node) -> Optional[str]:
+    if isinstance(node, Const) and not node.children:
+        node = state.constants[node.command]
+    if isinstance(node, Opcode) and node.token.token_type == TokenType.BYTE:
+        return node.immediate_args[0]
+    return None
+
+
+def state_tag(node: Opcode, tag: str) -> Tuple:
+    """Narrows `tag` down to a single key when `node` accesses the state by
+    a string literal key. Tags are hierarchical, `(tag,)` covers all keys."""
+    index = STATE_KEYS.get(node.command)
+    children = node.children or []
+    if index is None or len(children) != node.arg_height:
+        return (tag,)
+    key = literal_bytes(children[index])
+    return (tag,) if key is None else (tag, key)
+
+
+def reads(node: Node) -> Set[Tuple]:
+    """State tags `node` depends on"""
+    tags = set()
+    if is_load(node):
+        tags.add(('scratch', node.immediate_args[0]))
+    elif isinstance(node, Opcode) and node.command in STATE_READS:
+        tags.add(state_tag(node, STATE_READS[node.command]))
+    for child in node.children or []:
+        tags |= reads(child)
+    return tags
+
+
+def writes(node: Node) -> Set[Tuple]:
+    """State tags `node` itself modifies, excluding its children"""
+    if is_store(node):
+        return {('scratch', node.immediate_args[0])}
+    if isinstance(node, Opcode):
+        return {state_tag(node, tag)
+                for tag in STATE_WRITES.get(node.command, ())}
+    return set()
+
+
+def conflicts(read: Set[Tuple], written: Set[Tuple]) -> bool:
+    return any(r[:len(w)] == w or w[:len(r)] == r
+               for r in read for w in written)
+
+
+def statements(node: Node) -> List[Node]:
+    """Children of `node` including the preheader of loops"""
+    if isinstance(node, While):
+        return [*(node.preheader or []), *node.children]
+    return node.children or []
+
+
+def modified(node: Node) -> Optional[Set[Tuple]]:
+    """State tags possibly modified while evaluating `node`, or None if
+    that can not be told, like when code can jump into it."""
+    if isinstance(node, Label) or \
+            (isinstance(node, Opcode) and node.command in OPAQUE):
+        return None
+    tags = writes(node)
+    if isinstance(node, (ITxn, ITxnGroup)):
+        tags |= {(tag,) for tag in STATE_WRITES['itxn_submit']}
+    for child in statements(node):
+        child_tags = modified(child)
+        if child_tags is None:
+            return None
+        tags |= child_tags
+    return tags
+
+
+def expression_cost(node: Node) -> int:
+    if isinstance(node, Const):
+        return cost('int')
+    return node.spec.static_cost + sum(
+        expression_cost(child) for child in node.children or []
+    )
+
+
+def expression_key(node: Node) -> Tuple[str]:
+    return tuple(node.emit())
+
+
+def measure(nodes: List[Node]) -> Tuple[int, int]:
+    """Opcode cost and program size of `nodes`, without using up labels"""
+    label_counter = state.label_counter.copy()
+    lines = [line for node in nodes for line in node.emit()]
+    state.label_counter = label_counter
+    return sum(map(line_cost, lines)), sum(map(line_size, lines))
+
+
+def sections(node: Node) -> List[range]:
+    """Splits the children of a control node into runs of statements each
+    starting a basic block of its own."""
+    size = len(node.children or [])
+    if isinstance(node, (Case, While)):
+        return [range(0, 1), range(1, size)]
+    if isinstance(node, (Root, Label, ITxn, Import, Block)):
+        return [range(0, size)]
+    return [range(i, i + 1) for i in range(size)]
+
+
+class Block(Node):
+    """Straight-line statements produced by the optimizer"""
+
+    def emit(self) -> List[str]:
+        lines = []
+        for child in self.children:
+            lines.extend(child.emit())
+        return lines
+
+
+class Tee(Variable):
+    """Stores the value of its child while keeping it on the stack"""
+
+    def emit(self) -> List[str]:
+        lines = super().emit()
+        lines.insert(-1, 'dup')
+        return lines
+
+
+def scratch_variable(name: str, token: Token, children: List[Node] = None,
+                     config=None, cls=Variable) -> Variable:
+    return cls(Token(TokenType.VARIABLE, name, line=token.line,
+                     loc=token.loc, col=token.col),
+               children=children, config=config)
+
+
+@dataclass
+class Occurrence:
+
+    node: Node
+    parent: Node
+    index: int
+
+
+class CommonSubexpressions:
+    """Computes repeated pure expressions of a basic block only once, keeping
+    the result in a scratch slot when it is cheaper than recomputing it."""
+
+    def __init__(self):
+        self.groups: Dict[Tuple, List[Occurrence]] = defaultdict(list)
+        self.versions: Dict[Tuple, int] = defaultdict(lambda: 0)
+
+    def run(self, root: Root):
+        self.visit_control(root)
+
+    def visit_control(self, node: Node):
+        self.flush()
+        for section in sections(node):
+            for i in section:
+                self.visit(node.children[i], node, i)
+            self.flush()
+
+    def visit(self, node: Node, parent: Node, index: int):
+        if isinstance(node, Comment) or \
+                (isinstance(node, Const) and node.children):
+            return
+        if not isinstance(node, (Opcode, Const)):
+            self.visit_control(node)
+            return
+        for i, child in enumerate(node.children or []):
+            self.visit(child, node, i)
+        if isinstance(node, Opcode) and node.command in BARRIERS:
+            self.flush()
+            return
+        if is_pure(node):
+            key = (expression_key(node), tuple(
+                self.version(tag) for tag in sorted(reads(node))
+            ))
+            self.groups[key].append(Occurrence(node, parent, index))
+        for tag in writes(node):
+            self.invalidate(tag)
+
+    def version(self, tag: Tuple) -> Tuple:
+        # A read is invalidated by writes to its own tag, to any of its
+        # enclosing tags, or to any tag it encloses
+        prefixes = [tag[:i] for i in range(1, len(tag) + 1)]
+        return (*(self.versions['exact', prefix] for prefix in prefixes),
+                self.versions['any', tag])
+
+    def invalidate(self, tag: Tuple):
+        self.versions['exact', tag] += 1
+        for i in range(1, len(tag) + 1):
+            self.versions['any', tag[:i]] += 1
+
+    def flush(self):
+        groups = sorted(self.groups.values(),
+                        key=lambda group: -expression_cost(group[0].node))
+        self.groups.clear()
+        dead = set()
+        for group in groups:
+            group = [o for o in group if id(o.node) not in dead]
+            if len(group) < 2 or self.saving(group) <= 0:
+                continue
+            first, rest = group[0], group[1:]
+            name = allocate_label('cse')
+            if allocate_scratch_space(name) < 0:
+                continue
+            first.parent.children[first.index] = scratch_variable(
+                name, first.node.token, children=[first.node],
+                config=first.node.config, cls=Tee
+            )
+            for o in rest:
+                dead |= {id(n) for n in descendants(o.node)}
+                o.parent.children[o.index] = scratch_variable(
+                    name, o.node.token, config=o.node.config
+                )
+
+    def saving(self, group: List[Occurrence]) -> int:
+        repeats = len(group) - 1
+        overhead = cost('dup') + cost('store') + repeats * cost('load')
+        return repeats * expression_cost(group[0].node) - overhead
+
+
+class LoopInvariants:
+    """Hoists pure expressions of `@while` loops that do not depend on any
+    state modified by the loop into scratch slots evaluated once before the
+    loop starts."""
+
+    def run(self, root: Root):
+        for loop in self.loops(root):
+            self.hoist(loop)
+
+    def loops(self, node: Node):
+        # Inner loops first so their preheaders can be hoisted further
+        for child in statements(node):
+            yield from self.loops(child)
+        if isinstance(node, While):
+            yield node
+
+    def hoist(self, loop: While):
+        written = modified(loop)
+        if written is None:
+            return
+        groups: Dict[Tuple, List[Occurrence]] = defaultdict(list)
+        for i, child in enumerate(loop.children):
+            # Only the condition is evaluated on every entry, anything in
+            # the body must be safe to evaluate speculatively
+            self.collect(child, loop, i, written, groups, speculative=i > 0)
+
+        loop.preheader = loop.preheader or []
+        for group in groups.values():
+            first = group[0].node
+            name = allocate_label('licm')
+            if allocate_scratch_space(name) < 0:
+                continue
+            loop.preheader.append(scratch_variable(
+                name, first.token, children=[first], config=first.config
+            ))
+            for o in group:
+                o.parent.children[o.index] = scratch_variable(
+                    name, o.node.token, config=o.node.config
+                )
+
+    def collect(self, node: Node, parent: Node, index: int,
+                written: Set[Tuple], groups: Dict[Tuple, List[Occurrence]],
+                speculative: bool):
+        if isinstance(node, Comment) or \
+                (isinstance(node, Const) and node.children):
+            return
+        if is_pure(node) and not conflicts(reads(node), written) and \
+                expression_cost(node) > cost('load') and \
+                (not speculative or is_non_trapping(node)):
+            groups[expression_key(node)].append(
+                Occurrence(node, parent, index)
+            )
+            return
+        for i, child in enumerate(node.children or []):
+            self.collect(child, node, i, written, groups, speculative)
+        if isinstance(node, While):
+            for store in node.preheader or []:
+                self.collect(store, None, None, written, groups, speculative)
+
+
+@dataclass
+class Unrolling:
+
+    factor: int
+    cost: int
+    size: int
+
+
+@dataclass
+class Induction:
+
+    update: Variable
+    values: List[int]
+    final: int
+
+    @property
+    def slot(self) -> str:
+        return self.update.immediate_args[0]
+
+    @property
+    def steps(self) -> List[int]:
+        """Values of the induction variable after each update"""
+        return [*self.values[1:], self.final]
+
+
+class LoopUnrolling:
+    """Unrolls `@while` loops whose trip count is known at compile time,
+    either fully, turning loads of the induction variable into literals, or
+    partially, checking the condition once every few iterations.
+
+    The unrolling saving the most opcode cost within the program size limit
+    is chosen. When an opcode budget is configured, loops are only unrolled
+    as far as needed for the whole program to fit in it."""
+
+    def __init__(self, config):
+        self.config = config
+        self.root = None
+        self.program_size = 0
+
+    def run(self, root: Root):
+        self.root = root
+        self.program_size = measure([root])[1]
+        # Trip counts of all loops are needed up front to estimate the
+        # opcode cost of the program
+        loops = [(parent, index, loop, enclosing,
+                  self.induction(parent, index, loop))
+                 for parent, index, loop, enclosing in self.loops(root)]
+        for parent, index, loop, enclosing, induction in loops:
+            if induction:
+                self.unroll(parent, index, loop, enclosing, induction)
+
+    def loops(self, node: Node, enclosing: Tuple[While, ...] = ()):
+        # Inner loops first, so they are copied already unrolled
+        for i, child in enumerate(node.children or []):
+            if isinstance(child, While):
+                yield from self.loops(child, (*enclosing, child))
+                yield node, i, child, enclosing
+            else:
+                yield from self.loops(child, enclosing)
+
+    def body(self, loop: While) -> List[Node]:
+        return [c for c in loop.children[1:] if not isinstance(c, Comment)]
+
+    def induction(self, parent: Node, index: int,
+                  loop: While) -> Optional[Induction]:
+        """Finds the single statement of the body updating the induction
+        variable and simulates the loop"""
+        if loop.preheader:
+            return None
+        body = self.body(loop)
+        updates = [node for node in body if is_store(node)]
+        for update in updates:
+            slot = update.immediate_args[0]
+            others = [loop.children[0], *(n for n in body if n is not update)]
+            written = set()
+            for node in others:
+                tags = modified(node)
+                if tags is None:
+                    return None
+                written |= tags
+            if conflicts({('scratch', slot)}, written):
+                continue
+            init = self.initial_value(parent, index, slot)
+            if init is None:
+                continue
+            trip = self.trip(loop.children[0], update.children[0], slot, init)
+            if trip is None:
+                continue
+            values, final = trip
+            loop.trips = len(values)
+            return Induction(update=update, values=values, final=final)
+        return None
+
+    def unroll(self, parent: Node, index: int, loop: While,
+               enclosing: Tuple[While, ...], induction: Induction):
+        body = self.body(loop)
+        position = next(i for i, node in enumerate(body)
+                        if node is induction.update)
+        before, after = body[:position], body[position + 1:]
+        trips = len(induction.values)
+        multiplier = 1
+        for outer in enclosing:
+            multiplier *= outer.trips or 1
+
+        unrolling = self.choose(loop.children[0], [*before, *after],
+                                induction.update, trips, multiplier)
+        if unrolling is None:
+            return
+        if unrolling.factor == trips:
+            statements = self.copies(before, after, induction, trips)
+            statements.append(
+                self.assignment(induction.update, induction.final)
+            )
+            parent.children[index] = Block(loop.token, children=statements,
+                                           config=loop.config)
+        else:
+            repeats, prologue = divmod(trips, unrolling.factor)
+            loop.children = [loop.children[0], *[
+                copy.deepcopy(node)
+                for _ in range(unrolling.factor) for node in body
+            ]]
+            loop.trips = repeats
+            if prologue:
+                statements = self.copies(before, after, induction, prologue)
+                statements.append(self.assignment(
+                    induction.update, induction.values[prologue]
+                ))
+                statements.append(loop)
+                parent.children[index] = Block(loop.token,
+                                               children=statements,
+                                               config=loop.config)
+
+    def initial_value(self, parent: Node, index: int,
+                      slot: str) -> Optional[int]:
+        """Value of the induction variable on entering the loop, when it is
+        assigned a constant right before without jumps in between"""
+        for node in reversed(parent.children[:index]):
+            if isinstance(node, Comment) or \
+                    (isinstance(node, Const) and node.children):
+                continue
+            if is_store(node) and node.immediate_args[0] == slot:
+                return constant_value(node.children[0])
+            tags = modified(node)
+            if tags is None or conflicts({('scratch', slot)}, tags):
+                return None
+            if isinstance(node, Opcode) and node.command in BARRIERS:
+                return None
+        return None
+
+    def trip(self, condition: Node, step: Node, slot: str,
+             value: int) -> Optional[Tuple[List[int], int]]:
+        """Simulates the loop, returning the induction values of each
+        iteration and the value the loop exits with"""
+        values = []
+        while len(values) <= MAX_TRIP_COUNT:
+            check = constant_value(condition, {slot: value})
+            if check is None:
+                return None
+            if not check:
+                return values, value
+            values.append(value)
+            value = constant_value(step, {slot: value})
+            if value is None:
+                return None
+        return None
+
+    def outer_loops(self, node: Node):
+        if isinstance(node, While):
+            yield node
+            return
+        for child in node.children or []:
+            yield from self.outer_loops(child)
+
+    def estimate(self, nodes: List[Node]) -> int:
+        """Opcode cost of evaluating `nodes`, running each loop as many
+        times as it is known to iterate, or once if that is not known"""
+        total = measure(nodes)[0]
+        for loop in (inner for node in nodes
+                     for inner in self.outer_loops(node)):
+            trips = 1 if loop.trips is None else loop.trips
+            check = measure([loop.children[0]])[0] + cost('bz')
+            body = self.estimate(loop.children[1:])
+            total += (trips + 1) * check + trips * (body + cost('b')) - \
+                measure([loop])[0]
+        return total
+
+    def choose(self, condition: Node, body: List[Node], update: Node,
+               trips: int, multiplier: int) -> Optional[Unrolling]:
+        branch_size = langspec.opcodes['bz'].size + \
+            langspec.opcodes['b'].size
+        check_cost, check_size = measure([condition])
+        check_cost += cost('bz')
+        body_cost, body_size = measure(body)
+        update_cost, update_size = measure([update])
+        assign_cost, assign_size = cost('int') + cost('store'), \
+            line_size('int 0') + langspec.opcodes['store'].size
+
+        rolled = Unrolling(
+            factor=1,
+            cost=(trips + 1) * check_cost + trips * (
+                body_cost + update_cost + cost('b')
+            ),
+            size=check_size + body_size + update_size + branch_size,
+        )
+        candidates = [Unrolling(
+            factor=trips,
+            cost=trips * body_cost + assign_cost,
+            size=trips * body_size + assign_size,
+        )]
+        for factor in range(2, trips):
+            repeats, prologue = divmod(trips, factor)
+            candidates.append(Unrolling(
+                factor=factor,
+                cost=prologue * body_cost +
+                (assign_cost if prologue else 0) +
+                (repeats + 1) * check_cost +
+                repeats * (factor * (body_cost + update_cost) + cost('b')),
+                size=prologue * body_size +
+                (assign_size if prologue else 0) +
+                check_size + factor * (body_size + update_size) +
+                branch_size,
+            ))
+
+        # The budget covers the whole program, with loops nested in others
+        # running once for each iteration of the enclosing ones
+        budget = self.config.opcode_budget
+        program_cost = None
+        if budget is not None:
+            program_cost = self.estimate([self.root])
+            if program_cost <= budget:
+                return None
+        available = self.config.max_program_size - self.program_size + \
+            rolled.size
+        candidates = [c for c in candidates
+                      if c.cost < rolled.cost and c.size <= available]
+        if not candidates:
+            return None
+        fitting = [c for c in candidates if budget is not None and
+                   program_cost + (c.cost - rolled.cost) * multiplier <=
+                   budget]
+        if fitting:
+            chosen = min(fitting, key=lambda c: (c.size, c.cost))
+        else:
+            chosen = min(candidates, key=lambda c: (c.cost, c.size))
+        self.program_size += chosen.size - rolled.size
+        return chosen
+
+    def copies(self, before: List[Node], after: List[Node],
+               induction: Induction, count: int) -> List[Node]:
+        """Body of the first `count` iterations, statements before the
+        update seeing the induction value of the iteration and statements
+        after it the updated one"""
+        statements = []
+        for value, step in zip(induction.values[:count],
+                               induction.steps[:count]):
+            for nodes, current in ((before, value), (after, step)):
+                for node in nodes:
+                    statements.append(self.substitute(
+                        copy.deepcopy(node), induction.slot, current,
+                        induction.update
+                    ))
+        return statements
+
+    def substitute(self, node: Node, slot: str, value: int,
+                   update: Variable) -> Node:
+        """Replaces loads of the induction variable with a literal"""
+        if is_load(node) and node.immediate_args[0] == slot:
+            return self.literal(value, update)
+        if node.children:
+            node.children = [self.substitute(child, slot, value, update)
+                             for child in node.children]
+        return node
+
+    def literal(self, value: int, update: Variable) -> Opcode:
+        token = Token(TokenType.INT, str(value), line=update.token.line,
+                      loc=update.token.loc, col=update.token.col)
+        return Opcode(token, alias='int', immediate_args_override=[str(value)],
+                      doc=update.doc, config=update.config)
+
+    def assignment(self, update: Variable, value: int) -> Variable:
+        node = copy.deepcopy(update)
+        node.children = [self.literal(value, update)]
+        return node
+
+
+def optimize(root: Root) -> Root:
+    """Runs the optimization passes enabled in the config of `root`"""
+    if root.config.unroll:
+        LoopUnrolling(root.config).run(root)
+    if root.config.licm:
+        LoopInvariants().run(root)
+    if root.config.cse:
+        CommonSubexpressions().run(root)
+    return root
@@ -0,0 +1,188 @@
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Dict, List, Optional, Set
+
+from seal import langspec
+
+LABEL_SUFFIX = ':'
+COMMENT = ' // '
+
+# Opcodes after which execution never falls through to the next line
+TERMINATORS = {'b', 'return', 'err', 'retsub'}
+
+# Opcodes ending a basic block
+BRANCHES = TERMINATORS | {'bz', 'bnz', 'switch', 'match'}
+
+# Opcodes taking labels as immediate args
+LABEL_OPCODES = {'b', 'bz', 'bnz', 'callsub', 'switch', 'match'}
+
+
+def line_spec(line: str) -> Optional[langspec.Opcode]:
+    if not line or is_label(line) or line.startswith('#'):
+        return None
+    return langspec.opcodes.get(opcode(line))
+
+
+def line_cost(line: str) -> int:
+    spec = line_spec(line)
+    return spec.static_cost if spec else 0
+
+
+def line_size(line: str) -> int:
+    """Approximate size of the bytecode assembled from an emitted line"""
+    spec = line_spec(line)
+    if not spec:
+        return 1 if line.startswith('#pragma') else 0
+    name, _, rest = line.partition(' ')
+    if name == 'byte' and rest.startswith('"'):
+        return 2 + rest.index('"', 1) - 1
+    return spec.size
+
+
+def is_label(line: str) -> bool:
+    return line.endswith(LABEL_SUFFIX)
+
+
+def opcode(line: str) -> str:
+    return line.split(' ', 1)[0]
+
+
+def code(line: str) -> str:
+    """`line` without its trailing comment"""
+    index = line.find(COMMENT, line.rfind('"') + 1)
+    return line if index < 0 else line[:index]
+
+
+@dataclass(eq=False)
+class BasicBlock:
+
+    labels: List[str] = field(default_factory=list)
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def terminated(self) -> bool:
+        return bool(self.lines) and opcode(self.lines[-1]) in TERMINATORS
+
+
+def split(lines: List[str]) -> List[BasicBlock]:
+    blocks = [BasicBlock()]
+    for line in lines:
+        if not line:
+            continue
+        if is_label(line):
+            if blocks[-1].lines:
+                blocks.append(BasicBlock())
+            blocks[-1].labels.append(line[:-len(LABEL_SUFFIX)])
+        else:
+            blocks[-1].lines.append(line)
+            if opcode(line) in BRANCHES:
+                blocks.append(BasicBlock())
+    return [b for b in blocks if b.labels or b.lines]
+
+
+def join(blocks: List[BasicBlock]) -> List[str]:
+    lines = []
+    for block in blocks:
+        lines.extend(label + LABEL_SUFFIX for label in block.labels)
+        lines.extend(block.lines)
+    return lines
+
+
+class TailMerging:
+    """Shares code between basic blocks ending in an unconditional jump.
+
+    Identical blocks no other block falls through to are dropped and jumps
+    to them retargeted. Identical instruction suffixes are kept once under a
+    fresh label and replaced with a `b` elsewhere, as long as the suffix
+    takes more bytes than the branch does."""
+
+    def __init__(self, lines: List[str]):
+        self.blocks = split(lines)
+        self.labels: Set[str] = {
+            label for block in self.blocks for label in block.labels
+        }
+        self.counter = count()
+
+    def run(self) -> List[str]:
+        self.merge_blocks()
+        while self.merge_suffix():
+            pass
+        return join(self.blocks)
+
+    def fresh_label(self) -> str:
+        while True:
+            label = 'tail_{}'.format(next(self.counter))
+            if label not in self.labels:
+                self.labels.add(label)
+                return label
+
+    def label_of(self, block: BasicBlock) -> str:
+        if not block.labels:
+            block.labels.append(self.fresh_label())
+        return block.labels[0]
+
+    def merge_blocks(self):
+        seen: Dict[tuple, BasicBlock] = {}
+        renames: Dict[str, str] = {}
+        blocks = []
+        for block in self.blocks:
+            reachable_by_fallthrough = blocks and not blocks[-1].terminated
+            key = tuple(map(code, block.lines))
+            if block.terminated and key in seen and \
+                    not reachable_by_fallthrough:
+                if block.labels:
+                    target = self.label_of(seen[key])
+                    renames.update({label: target for label in block.labels})
+                continue
+            if block.terminated:
+                seen.setdefault(key, block)
+            blocks.append(block)
+        self.blocks = blocks
+        for block in self.blocks:
+            block.lines = [self.retarget(line, renames)
+                           for line in block.lines]
+
+    def retarget(self, line: str, renames: Dict[str, str]) -> str:
+        if opcode(line) not in LABEL_OPCODES:
+            return line
+        name, *args = code(line).split(' ')
+        if not set(args) & set(renames):
+            return line
+        return ' '.join([name, *[renames.get(arg, arg) for arg in args]])
+
+    def merge_suffix(self) -> bool:
+        branch_size = langspec.opcodes['b'].size
+        best = None
+        terminated = [b for b in self.blocks if b.terminated]
+        for i, kept in enumerate(terminated):
+            for replaced in terminated[i + 1:]:
+                length = self.common_suffix(kept, replaced)
+                saving = sum(map(line_size, replaced.lines[-length:])) - \
+                    branch_size if length else 0
+                if saving > 0 and (best is None or saving > best[0]):
+                    best = (saving, kept, replaced, length)
+        if best is None:
+            return False
+
+        _, kept, replaced, length = best
+        if length < len(kept.lines):
+            tail = BasicBlock(lines=kept.lines[-length:])
+            kept.lines = kept.lines[:-length]
+            index = next(i for i, b in enumerate(self.blocks) if b is kept)
+            self.blocks.insert(index + 1, tail)
+            kept = tail
+        replaced.lines = replaced.lines[:-length]
+        replaced.lines.append('b {}'.format(self.label_of(kept)))
+        return True
+
+    def common_suffix(self, a: BasicBlock, b: BasicBlock) -> int:
+        length = 0
+        for x, y in zip(reversed(a.lines), reversed(b.lines)):
+            if code(x) != code(y):
+                break
+            length += 1
+        return length
+
+
+def merge_tails(lines: List[str]) -> List[str]:
+    return TailMerging(lines).run()
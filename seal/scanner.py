@@ -16,6 +16,8 @@ CASE = '@case'
 WHILE = '@while'
 FN = '@fn'
 ITXN = '@itxn'
+ITXN_GROUP = '@itxn_group'
+IMPORT = '@import'
 
 
 TERMINALS = [LEFT_PAREN, RIGHT_PAREN, STRING_DELIMETER, NEWLINE]
@@ -36,6 +38,8 @@ TokenType = Enum('TokenType', [
     'ROOT',
     'CONSTANT',
     'ITXN',
+    'ITXN_GROUP',
+    'IMPORT',
 ])
 
 
@@ -51,6 +55,7 @@ class Token(Generic[T]):
     line: Optional[int] = 0
     loc: Optional[int] = 0
     col: Optional[int] = 0
+    path: Optional[str] = None
 
     @classmethod
     def root(cls) -> T:
@@ -73,7 +78,8 @@ class Token(Generic[T]):
         return '{}({})'.format(self.token_type.name, self.value)
 
 
-def scan(f: TextIO) -> Generator[Token, None, None]:
+def scan(f: TextIO,
+         path: Optional[str] = None) -> Generator[Token, None, None]:
 
     line = 1
     col = 1
@@ -104,6 +110,7 @@ def scan(f: TextIO) -> Generator[Token, None, None]:
         kwargs['line'] = line
         kwargs['loc'] = loc
         kwargs['col'] = col
+        kwargs['path'] = path
         return Token(*args, **kwargs)
 
     c = consume_one()
@@ -144,6 +151,10 @@ def scan(f: TextIO) -> Generator[Token, None, None]:
                 yield token(TokenType.FN, value)
             elif value == ITXN:
                 yield token(TokenType.ITXN, value)
+            elif value == ITXN_GROUP:
+                yield token(TokenType.ITXN_GROUP, value)
+            elif value == IMPORT:
+                yield token(TokenType.IMPORT, value)
             else:
                 yield token(TokenType.OPCODE, value)
         else:
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import seal
+from seal import compiler
+
+
+def test_compile_reports_error_position():
+    result = seal.compile('(log "a")\n  (bogus 1)')
+    assert not result.ok
+    assert result.teal is None
+    error, = result.errors
+    assert error.message == 'Invalid opcode'
+    assert (error.line, error.token) == (2, 'bogus')
+
+
+def test_compile_many_keeps_submission_order():
+    sources = ['(log "{}")'.format(i) for i in range(8)] + ['(bogus)']
+    results = asyncio.run(seal.compile_many(sources, concurrency=3))
+    assert [r.ok for r in results] == [True] * 8 + [False]
+    for i, result in enumerate(results[:8]):
+        assert 'byte "{}"'.format(i) in result.teal
+    assert results[-1].errors[0].token == 'bogus'
+
+
+def test_compile_many_bounds_concurrency(monkeypatch):
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def slow_compile(source, config=None, path=None):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return compiler.CompileResult(teal=source)
+
+    monkeypatch.setattr(compiler, 'compile', slow_compile)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = asyncio.run(seal.compile_many(
+            [str(i) for i in range(10)], executor=executor, concurrency=2
+        ))
+    assert [r.teal for r in results] == [str(i) for i in range(10)]
+    assert peak[0] == 2
+
+
+def test_compile_many_holds_slot_of_timed_out_compilation(monkeypatch):
+    events = []
+
+    def slow_compile(source, config=None, path=None):
+        events.append(('start', source))
+        if source == 'slow':
+            time.sleep(0.2)
+        events.append(('end', source))
+        return compiler.CompileResult(teal=source)
+
+    monkeypatch.setattr(compiler, 'compile', slow_compile)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        slow, fast = asyncio.run(seal.compile_many(
+            ['slow', 'fast'], executor=executor, timeout=0.05, concurrency=1
+        ))
+    assert slow.errors[0].message == 'Compilation timed out after 0.05s'
+    assert fast.teal == 'fast'
+    assert events.index(('end', 'slow')) < events.index(('start', 'fast'))
+
+
+def test_compile_async_timeout(monkeypatch):
+    def slow_compile(source, config=None, path=None):
+        time.sleep(0.1)
+        return compiler.CompileResult(teal=source)
+
+    monkeypatch.setattr(compiler, 'compile', slow_compile)
+    result = asyncio.run(seal.compile_async('x', timeout=0.01))
+    assert not result.ok
+    assert 'timed out' in result.errors[0].message
@@ -0,0 +1,67 @@
+import seal
+
+
+def lines(source):
+    result = seal.compile(source)
+    assert result.ok, result.errors
+    return result.teal.splitlines()[1:]
+
+
+def test_itxn_emits_first_field():
+    assert lines('''
+        (@itxn
+            (itxn_field.TypeEnum int.pay)
+            (itxn_field.Amount 1000)
+        )
+    ''') == [
+        'itxn_begin',
+        'int pay',
+        'itxn_field TypeEnum',
+        'int 1000',
+        'itxn_field Amount',
+        'itxn_submit',
+    ]
+
+
+def test_itxn_rejects_repeated_field():
+    result = seal.compile(
+        '(@itxn (itxn_field.Amount 1) (itxn_field.Amount 2))'
+    )
+    error, = result.errors
+    assert error.message == 'Field Amount assigned more than once'
+
+
+def test_itxn_allows_repeated_array_field():
+    assert lines('''
+        (@itxn
+            (itxn_field.Accounts txn.Sender)
+            (itxn_field.Accounts txn.Sender)
+        )
+    ''').count('itxn_field Accounts') == 2
+
+
+def test_itxn_group():
+    assert lines('''
+        (@itxn_group
+            (@itxn (itxn_field.TypeEnum int.pay))
+            (@itxn (itxn_field.TypeEnum int.axfer))
+            (@itxn (itxn_field.TypeEnum int.appl))
+        )
+    ''') == [
+        'itxn_begin',
+        'int pay',
+        'itxn_field TypeEnum',
+        'itxn_next',
+        'int axfer',
+        'itxn_field TypeEnum',
+        'itxn_next',
+        'int appl',
+        'itxn_field TypeEnum',
+        'itxn_submit // 3 itxn grouped, saves 2 opcodes',
+    ]
+
+
+def test_itxn_group_requires_itxn_children():
+    result = seal.compile('(@itxn_group (log "a"))')
+    assert result.errors[0].message == \
+        '#itxn_group requires all childs to be a #itxn'
@@ -0,0 +1,176 @@
+import asyncio
+import os
+
+import seal
+from seal.config import Config
+from seal.modules import ModuleCache
+
+
+def write(path, source):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(source)
+    return str(path)
+
+
+def test_import_relative_to_importer(tmp_path):
+    write(tmp_path / 'lib' / 'common.seal', '($MAX 5)')
+    main = write(tmp_path / 'main.seal', '(@import "lib/common.seal")')
+    result = seal.compile('(@import "lib/common.seal") (log (itob $MAX))',
+                          path=main)
+    assert result.ok, result.errors
+    assert 'int 5 // $MAX' in result.teal
+
+
+def test_import_within_import_paths(tmp_path):
+    write(tmp_path / 'common.seal', '($MAX 5)')
+    write(tmp_path / 'lib' / 'a.seal', '(@import "../common.seal")')
+    result = seal.compile('(@import "lib/a.seal") (log (itob $MAX))',
+                          Config(import_paths=[str(tmp_path)]))
+    assert result.ok, result.errors
+
+
+def test_import_rejects_paths_outside_import_paths(tmp_path):
+    secret = write(tmp_path / 'secret.seal', 'vm')
+    (tmp_path / 'lib').mkdir()
+    os.symlink(secret, str(tmp_path / 'lib' / 'link.seal'))
+    config = Config(import_paths=[str(tmp_path / 'lib')])
+    for name in ['../secret.seal', 'link.seal', secret]:
+        result = seal.compile('(@import "{}")'.format(name), config)
+        error, = result.errors
+        assert error.message == 'Module {} not found'.format(name)
+        assert error.path is None
+
+
+def test_identical_modules_report_their_own_path(tmp_path):
+    for name in ['e1.seal', 'e2.seal']:
+        write(tmp_path / name, '(bogus)')
+    config = Config(import_paths=[str(tmp_path)])
+    for name in ['e1.seal', 'e2.seal']:
+        error, = seal.compile('(@import "{}")'.format(name), config).errors
+        assert error.path == os.path.realpath(str(tmp_path / name))
+
+
+def test_module_cache_evicts_least_recently_used(tmp_path):
+    cache = ModuleCache(max_size=2)
+    a, b, c = [write(tmp_path / name, '($X 1)')
+               for name in ['a.seal', 'b.seal', 'c.seal']]
+    tokens = cache.tokens(a)
+    cache.tokens(b)
+    assert cache.tokens(a) is tokens
+    cache.tokens(c)
+    assert [path for path, _ in cache.modules] == [a, c]
+
+
+def test_async_compilation_resolves_imports_relative_to_path(tmp_path):
+    write(tmp_path / 'lib' / 'common.seal', '($MAX 5)')
+    main = str(tmp_path / 'main.seal')
+    source = '(@import "lib/common.seal") (log (itob $MAX))'
+    result = asyncio.run(seal.compile_async(source, path=main))
+    assert result.ok, result.errors
+    first, second = asyncio.run(seal.compile_many([source, source],
+                                                  paths=[main, None]))
+    assert first.ok, first.errors
+    assert second.errors[0].message == 'Module lib/common.seal not found'
+
+
+def lines(result):
+    assert result.ok, result.errors
+    return result.teal.splitlines()[1:]
+
+
+def test_call_subroutine_of_module_by_qualified_label(tmp_path):
+    write(tmp_path / 'lib' / 'common.seal', '''
+        (b.end)
+        (helper: (retsub))
+        (end:)
+    ''')
+    main = str(tmp_path / 'main.seal')
+    assert lines(seal.compile('''
+        (@import "lib/common.seal")
+        (callsub.common.helper)
+        (callsub.helper)
+        (helper: (retsub))
+    ''', path=main)) == [
+        'b common__end',
+        'common__helper:',
+        'retsub',
+        'common__end:',
+        'callsub common__helper',
+        'callsub helper',
+        'helper:',
+        'retsub',
+    ]
+
+
+def test_qualified_label_requires_imported_module():
+    error, = seal.compile('(callsub.common.helper)').errors
+    assert error.message == 'Module common not imported'
+
+
+def test_modules_with_same_namespace_are_rejected(tmp_path):
+    write(tmp_path / 'a' / 'common.seal', '(x: (retsub))')
+    write(tmp_path / 'b' / 'common.seal', '(y: (retsub))')
+    source = '(@import "a/common.seal") (@import "b/common.seal")'
+    error, = seal.compile(source, path=str(tmp_path / 'main.seal')).errors
+    assert error.message == \
+        'Module namespace common already used by another module'
+
+
+def test_circular_import_between_two_modules(tmp_path):
+    write(tmp_path / 'a.seal', '(@import "b.seal")')
+    b = write(tmp_path / 'b.seal', '(@import "a.seal")')
+    error, = seal.compile('(@import "a.seal")',
+                          path=str(tmp_path / 'main.seal')).errors
+    assert error.message == 'Circular import of module a.seal'
+    assert error.path == os.path.realpath(b)
+
+
+def test_circular_import_of_module_itself(tmp_path):
+    path = write(tmp_path / 'self.seal', '(@import "self.seal")')
+    error, = seal.compile('(@import "self.seal")',
+                          path=str(tmp_path / 'main.seal')).errors
+    assert error.message == 'Circular import of module self.seal'
+    assert error.path == os.path.realpath(path)
+
+
+def test_module_variables_and_labels_do_not_clash(tmp_path):
+    write(tmp_path / 'common.seal', '($tmp 1) (b.done) (done:)')
+    assert lines(seal.compile('''
+        (@import "common.seal")
+        ($tmp 2)
+        (b.done)
+        (done:)
+    ''', path=str(tmp_path / 'main.seal'))) == [
+        'int 1',
+        'store 0 // $tmp',
+        'b common__done',
+        'common__done:',
+        'int 2',
+        'store 1 // $tmp',
+        'b done',
+        'done:',
+    ]
+
+
+def test_module_imported_twice_is_emitted_once(tmp_path):
+    write(tmp_path / 'consts.seal', '($MAX 5) (log "lib")')
+    teal = lines(seal.compile('''
+        (@import "consts.seal")
+        (@import "consts.seal")
+        (log (itob $MAX))
+    ''', path=str(tmp_path / 'main.seal')))
+    assert teal == ['byte "lib"', 'log', 'int 5 // $MAX', 'itob', 'log']
+
+
+def test_module_imported_through_two_importers_is_emitted_once(tmp_path):
+    write(tmp_path / 'consts.seal', '($MAX 5) (log "lib")')
+    for name in ['x', 'y']:
+        write(tmp_path / '{}.seal'.format(name),
+              '(@import "consts.seal") (log (itob (+ $MAX 1)))')
+    teal = lines(seal.compile('''
+        (@import "x.seal")
+        (@import "y.seal")
+        (log (itob $MAX))
+    ''', path=str(tmp_path / 'main.seal')))
+    assert teal.count('byte "lib"') == 1
+    assert teal.count('int 5 // $MAX') == 3
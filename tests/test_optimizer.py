@@ -0,0 +1,194 @@
+import seal
+from seal.config import Config
+
+
+def lines(source, **options):
+    result = seal.compile(source, Config(**options))
+    assert result.ok, result.errors
+    return result.teal.splitlines()[1:]
+
+
+def test_cse_tees_first_occurrence_and_loads_the_rest():
+    assert lines('''
+        ($a (sha256 (sha256 "x")))
+        ($b (sha256 (sha256 "x")))
+    ''', cse=True) == [
+        'byte "x"',
+        'sha256',
+        'sha256',
+        'dup',
+        'store 2 // cse_0',
+        'store 0 // $a',
+        'load 2 // cse_0',
+        'store 1 // $b',
+    ]
+
+
+def test_cse_leaves_cheap_expressions_alone():
+    source = '($a (+ 1 2)) ($b (+ 1 2))'
+    assert lines(source, cse=True) == lines(source)
+
+
+def test_cse_does_not_reuse_across_write_to_same_key():
+    source = '''
+        ($a (sha256 (app_global_get "k")))
+        (app_global_put "k" 1)
+        ($b (sha256 (app_global_get "k")))
+    '''
+    assert lines(source, cse=True) == lines(source)
+
+
+def test_cse_reuses_across_write_to_other_key():
+    assert 'load 2 // cse_0' in lines('''
+        ($a (sha256 (app_global_get "k")))
+        (app_global_put "j" 1)
+        ($b (sha256 (app_global_get "k")))
+    ''', cse=True)
+
+
+def test_cse_does_not_reuse_min_balance_across_box_writes():
+    for write in ['(assert (box_create "k" 100))', '(box_put "k" "v")',
+                  '(assert (box_del "k"))']:
+        source = '''
+            ($a (sha256 (itob (min_balance global.CurrentApplicationAddress))))
+            {}
+            ($b (sha256 (itob (min_balance global.CurrentApplicationAddress))))
+        '''.format(write)
+        assert lines(source, cse=True) == lines(source)
+
+
+def test_cse_does_not_reuse_across_branches():
+    source = '''
+        ($a (sha256 (sha256 "x")))
+        (bnz.skip 1)
+        ($b (sha256 (sha256 "x")))
+        (skip: (log "a"))
+    '''
+    assert lines(source, cse=True) == lines(source)
+
+
+def test_cse_does_not_reuse_across_blocks():
+    for source in [
+        '($a (sha256 (sha256 "x"))) (@case $a ($b (sha256 (sha256 "x"))))',
+        '($a (sha256 (sha256 "x"))) (skip: ($b (sha256 (sha256 "x"))))',
+    ]:
+        assert lines(source, cse=True) == lines(source)
+
+
+def loop(body, condition='(< $i txn.NumAppArgs)'):
+    return '($i 0) (@while {} {} ($i (+ $i 1)))'.format(condition, body)
+
+
+def test_licm_hoists_body_expression_of_known_types():
+    assert lines(loop('(log (sha256 global.CurrentApplicationAddress))'),
+                 licm=True)[:6] == [
+        'int 0',
+        'store 0 // $i',
+        'global CurrentApplicationAddress',
+        'sha256',
+        'store 1 // licm_0',
+        'while_0:',
+    ]
+
+
+def test_licm_hoists_condition_expression_of_unknown_type():
+    assert lines(loop('(log "x")', condition='(< $i (app_global_get "n"))'),
+                 licm=True)[2:5] == [
+        'byte "n"',
+        'app_global_get',
+        'store 1 // licm_0',
+    ]
+
+
+def test_licm_does_not_hoist_body_expression_of_unknown_type():
+    for body in ['(log (sha256 (app_global_get "name")))',
+                 '(assert (== txn.Sender txn.Fee))',
+                 '(log (itob (+ txn.Fee 1)))']:
+        source = loop(body)
+        assert lines(source, licm=True) == lines(source)
+
+
+def test_licm_does_not_hoist_expression_written_by_loop():
+    source = loop('(app_global_put "n" 1)',
+                  condition='(< $i (app_global_get "n"))')
+    assert lines(source, licm=True) == lines(source)
+
+
+def counted(name, trips, body, update_first=False):
+    update = '(${0} (+ ${0} 1))'.format(name)
+    statements = [update, body] if update_first else [body, update]
+    return '(${} 0) (@while (< ${} {}) {} {})'.format(
+        name, name, trips, *statements
+    )
+
+
+def test_unroll_fully():
+    assert lines(counted('i', 3, '(log (itob $i))'), unroll=True) == [
+        'int 0',
+        'store 0 // $i',
+        'int 0 // $i',
+        'itob',
+        'log',
+        'int 1 // $i',
+        'itob',
+        'log',
+        'int 2 // $i',
+        'itob',
+        'log',
+        'int 3 // $i',
+        'store 0 // $i',
+    ]
+
+
+def test_unroll_with_update_before_body():
+    teal = lines(counted('i', 3, '(log (itob $i))', update_first=True),
+                 unroll=True)
+    assert [line for line in teal if line.startswith('int')] == [
+        'int 0', 'int 1 // $i', 'int 2 // $i', 'int 3 // $i', 'int 3 // $i'
+    ]
+
+
+def test_unroll_loop_without_statements():
+    source = '($i 0) (@while (< $i 3) `comment`)'
+    assert lines(source, unroll=True) == lines(source)
+
+
+def test_unroll_partially_with_prologue():
+    teal = lines(counted('i', 9, '(log (sha256 (itob $i)))',
+                         update_first=True),
+                 unroll=True, opcode_budget=410)
+    prologue = teal[:teal.index('while_0:')]
+    assert prologue == [
+        'int 0',
+        'store 0 // $i',
+        'int 1 // $i',
+        'itob',
+        'sha256',
+        'log',
+        'int 1 // $i',
+        'store 0 // $i',
+    ]
+    assert teal.count('sha256') == 3
+    assert teal[-2:] == ['b while_0', 'while_0_end:']
+
+
+def test_unroll_within_program_size():
+    source = counted('i', 10, '(log (itob $i))')
+    assert 'while_0:' not in lines(source, unroll=True)
+    assert lines(source, unroll=True, max_program_size=30) == lines(source)
+
+
+def test_unroll_within_opcode_budget():
+    source = counted('i', 3, '(log (itob $i))')
+    assert lines(source, unroll=True, opcode_budget=100) == lines(source)
+    assert 'while_0:' not in lines(source, unroll=True, opcode_budget=20)
+
+
+def test_unroll_opcode_budget_covers_whole_program():
+    # Each loop fits in the budget on its own, but both together do not
+    source = counted('i', 3, '(log (itob $i))') + \
+        counted('j', 3, '(log (itob $j))')
+    teal = lines(source, unroll=True, opcode_budget=60)
+    assert teal.count('while_0:') == 1
+    assert 'int 2 // $i' in teal
+    assert 'load 1 // $j' in teal
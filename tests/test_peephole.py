@@ -0,0 +1,104 @@
+from seal.peephole import merge_tails
+
+DONE = ['byte "done"', 'log', 'int 1', 'return']
+
+
+def test_drops_duplicate_blocks_and_retargets_branches():
+    assert merge_tails([
+        'txn Fee',
+        'bz second',
+        'txn Amount',
+        'bz first',
+        'b second',
+        'first:',
+        *DONE,
+        'second:',
+        *DONE,
+    ]) == [
+        'txn Fee',
+        'bz first',
+        'txn Amount',
+        'bz first',
+        'b first',
+        'first:',
+        *DONE,
+    ]
+
+
+def test_keeps_duplicate_block_reached_by_fall_through():
+    assert merge_tails([
+        'txn Fee',
+        'bz second',
+        'first:',
+        *DONE,
+        'txn Amount',
+        'bz first',
+        'second:',
+        *DONE,
+    ]) == [
+        'txn Fee',
+        'bz second',
+        'first:',
+        *DONE,
+        'txn Amount',
+        'bz first',
+        'second:',
+        'b first',
+    ]
+
+
+def test_splits_shared_suffix_under_fresh_label():
+    assert merge_tails([
+        'txn Fee',
+        'bz second',
+        'byte "a"',
+        'log',
+        *DONE,
+        'second:',
+        'byte "b"',
+        'log',
+        *DONE,
+    ]) == [
+        'txn Fee',
+        'bz second',
+        'byte "a"',
+        'tail_0:',
+        'log',
+        *DONE,
+        'second:',
+        'byte "b"',
+        'b tail_0',
+    ]
+
+
+def test_does_not_merge_suffix_not_larger_than_branch():
+    # `int 1` and `return` take 3 bytes, just as the `b` replacing them
+    lines = [
+        'txn Fee',
+        'bz second',
+        'int 2',
+        'int 1',
+        'return',
+        'second:',
+        'int 3',
+        'int 1',
+        'return',
+    ]
+    assert merge_tails(lines) == lines
+
+
+def test_merges_suffix_larger_than_branch():
+    # With `pop` in common the suffix takes 4 bytes
+    assert merge_tails([
+        'txn Fee',
+        'bz second',
+        'int 2',
+        'pop',
+        'int 1',
+        'return',
+        'second:',
+        'int 3',
+        'pop',
+        'int 1',
+        'return',
+    ])[-2:] == ['int 3', 'b tail_0']